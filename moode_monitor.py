@@ -1,8 +1,10 @@
-import subprocess
+import json
+import os
 import sys
+import threading
 import re
+import socket
 from pathlib import Path
-import glob
 import time
 import yaml
 import logging
@@ -10,56 +12,245 @@ import logging.handlers
 import paho.mqtt.client as mqtt
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from collections import deque
-from datetime import datetime, timedelta
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 from rapidfuzz import fuzz
 import unicodedata
 
+# Use the libyaml C parser when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
 # Configuration file
 CONFIG_PATH = 'moode_config.yaml'
 config = {}
-
-class LogCache:
-    """Cache for log file reads to reduce I/O operations"""
-    def __init__(self, max_age_seconds=5):
-        self.cache = {}
-        self.max_age = timedelta(seconds=max_age_seconds)
-    
-    def get(self, key):
-        """Get cached value if not expired"""
-        if key in self.cache:
-            entry, timestamp = self.cache[key]
-            if datetime.now() - timestamp < self.max_age:
-                return entry
-            del self.cache[key]
-        return None
-    
-    def set(self, key, value):
-        """Cache a value with current timestamp"""
-        self.cache[key] = (value, datetime.now())
+# Every key read from the config, anything else is most likely a typo
+CONFIG_KEYS = frozenset({
+    'mqtt_server', 'mqtt_port', 'mqtt_username', 'mqtt_password', 'mqtt_qos',
+    'spotify_client_id', 'spotify_client_secret',
+    'mpd_socket', 'mpd_host', 'mpd_port', 'mpd_timeout', 'mpd_update_interval',
+    'state_topic', 'source_topic', 'details_topic', 'track_topic', 'command_topic',
+    'debug', 'max_lines_librespot', 'max_lines_airplay',
+    'poll_interval', 'max_poll_interval',
+})
+
+# Rescan a log from its tail instead of catching up when it grew by more than this
+MAX_TAIL_BYTES = 65536
+# Bytes kept from just before the read offset to recognise the same log again
+MARK_BYTES = 32
+
+# Precompiled patterns used by the polling functions
+LOADING_RE = re.compile(rb'Loading <(.+?)> with')
+DEVICE_NAME_RE = re.compile(rb'\("([^"]+)"\)')
+RADIO_HOST_CLEANUP_RE = re.compile(r'\.\w{2,3}$|\b(?:live|stream)\b')
+DOTS_TO_SPACES = str.maketrans('.', ' ')
+TRAILING_NUMBER_RE = re.compile(r'\s*\*\s*[-+]?\d+$')
+WORD_RE = re.compile(r'\w+')
+
+# A changed state must be read again after this delay before it is published
+DEBOUNCE_SECONDS = 0.5
+
+# Reuse the last state for this long while the same PID owns the PCM
+STATE_CACHE_SECONDS = 5
+cached_state = None
+cached_state_time = 0
+# Bumped on every invalidation, a read that overlapped one must not be cached
+state_generation = 0
+# Last state read, survives invalidation and stands in while MPD is not answering
+last_state = None
+owner_pid = None
+owner_name = None
+
+# ALSA substream status files, kept open and re-read in place on every poll
+ASOUND_PATH = '/proc/asound'
+STATUS_FILES_REFRESH = 60
+status_fds = []
+# -inf: not opened yet, or a read failed and they must be reopened
+status_fds_opened = float('-inf')
+
+class TailReader:
+    """Follow a log file and parse only the lines appended since the last read"""
+    def __init__(self, path, max_lines):
+        self.path = path
+        self.max_lines = max_lines
+        self.size = 0
+        self.fd = None
+        self.reset(None)
+
+    def reset(self, inode):
+        """Forget everything parsed from a previous file"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.inode = inode
+        self.offset = 0
+        # Last bytes before offset, to notice a log rewritten in place past offset
+        self.mark = b''
+        self.result = None
+
+    def read_new(self, size):
+        """Return the complete lines appended since the last call"""
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        data = os.pread(self.fd, size - self.offset, self.offset)
+        # Leave an unterminated last line for the next call
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        self.mark = (self.mark + data[:end])[-MARK_BYTES:]
+        return [line for line in data[:end].split(b'\n') if line]
+
+    def read_tail(self, size):
+        """Return the last max_lines complete lines of the file as one bytes buffer"""
+        self.fd = os.open(self.path, os.O_RDONLY)
+        start = max(0, size - MAX_TAIL_BYTES)
+        data = os.pread(self.fd, size - start, start)
+        # Leave an unterminated last line for read_new, like any appended bytes
+        end = data.rfind(b'\n') + 1
+        self.offset = start + end
+        data = data[:end]
+        self.mark = data[-MARK_BYTES:]
+        if start:
+            # The window most likely starts mid-line, drop that piece
+            data = data[data.find(b'\n') + 1:]
+        pos = len(data)
+        for _ in range(self.max_lines + 1):
+            pos = data.rfind(b'\n', 0, pos)
+            if pos < 0:
+                break
+        return data[pos + 1:]
+
+    def latest(self):
+        """Parse any new bytes and return the most recent result"""
+        st = os.stat(self.path)
+        if st.st_ino == self.inode and st.st_size == self.size:
+            # Nothing was written since the last read
+            return self.result
+
+        if (st.st_ino != self.inode or st.st_size < self.offset
+                or st.st_size - self.offset > MAX_TAIL_BYTES or self.rewritten()):
+            # New, rotated or truncated log: search its most recent lines from the end
+            self.reset(st.st_ino)
+            self.scan_tail(self.read_tail(st.st_size))
+        else:
+            # Keep the log open between polls and read the new bytes in place
+            for line in self.read_new(st.st_size):
+                self.handle_line(line)
+
+        self.size = st.st_size
+        return self.result
+
+    def rewritten(self):
+        """Check whether the log was truncated and written past offset again since the last read"""
+        return bool(self.mark) and os.pread(
+            self.fd, len(self.mark), self.offset - len(self.mark)) != self.mark
+
+    @staticmethod
+    def line_at(data, pos):
+        """Return the line of data that contains offset pos"""
+        end = data.find(b'\n', pos)
+        return data[data.rfind(b'\n', 0, pos) + 1:end if end >= 0 else len(data)]
+
+    def scan_tail(self, data):
+        """Set up state from the tail of a log, by default replaying it line by line"""
+        for line in data.split(b'\n'):
+            if line:
+                self.handle_line(line)
+
+    def handle_line(self, line):
+        """Update self.result from a raw log line"""
+        raise NotImplementedError
+
+class LibrespotLog(TailReader):
+    """Current Spotify song from the librespot log"""
+    def reset(self, inode):
+        super().reset(inode)
+        self.pending = None
+
+    def parse_loading(self, line):
+        match = LOADING_RE.search(line)
+        return match.group(1).decode('utf-8', 'replace') if match else None
+
+    def scan_tail(self, data):
+        # The confirmed song is the last one loaded before the last play event,
+        # anything loaded after that is still pending
+        play = data.rfind(b'kPlayStatusPlay')
+        if play >= 0:
+            loading = data.rfind(b'Loading <', 0, play)
+            if loading >= 0:
+                self.result = self.parse_loading(self.line_at(data, loading))
+        loading = data.rfind(b'Loading <')
+        if loading >= 0:
+            self.pending = self.parse_loading(self.line_at(data, loading))
+
+    def handle_line(self, line):
+        # Remember loaded songs, confirm them once playback starts
+        if b'kPlayStatusPlay' in line:
+            if self.pending:
+                self.result = self.pending
+        elif b'Loading <' in line:
+            self.pending = self.parse_loading(line) or self.pending
+
+class ShairportLog(TailReader):
+    """Most recently connected AirPlay device from the shairport-sync log"""
+    def scan_tail(self, data):
+        # Only the last connection matters
+        pos = data.rfind(b'connection from')
+        if pos >= 0:
+            self.handle_line(self.line_at(data, pos))
+
+    def handle_line(self, line):
+        if b'connection from' in line:
+            match = DEVICE_NAME_RE.search(line)
+            if match:
+                self.result = match.group(1).decode('utf-8', 'replace')
 
 class LogWatcher(FileSystemEventHandler):
     """Watch for changes in log files and trigger updates"""
-    WATCHED_FILES = [
+    WATCHED_FILES = frozenset({
         '/var/log/moode_librespot.log',
         '/var/log/moode_shairport-sync.log'
-    ]
+    })
     
     def __init__(self, callback):
         self.callback = callback
         
     def on_modified(self, event):
-        for watched in self.WATCHED_FILES:
-            if event.src_path == watched:
-                self.callback()
+        # Every file in /var/log reports here, keep the check a set lookup
+        if event.src_path in self.WATCHED_FILES:
+            self.callback()
 
 class MQTTHandler:
+    __slots__ = ('client', 'connected', 'pending', 'lock', 'current', 'sent', 'qos', 'state_topic',
+                 'source_topic', 'details_topic', 'track_topic', 'command_topic')
+
     def __init__(self, config):
         """Initialize MQTT client"""
-        self.config = config
         self.connected = False
+        # QoS 1 publishes still waiting for their PUBACK, appended to from the
+        # monitor loop and the track lookup worker, counted by the network thread
+        self.pending = []
+        self.lock = threading.Lock()
+        # Latest payload per state topic, republished on (re)connect since paho
+        # drops QoS 0 publishes made while there is no connection
+        self.current = {}
+        # Payload per state topic that paho last accepted, unchanged values are skipped
+        self.sent = {}
+
+        # Topics are fixed after startup, look them up once
+        self.state_topic = config.get('state_topic')
+        self.source_topic = config.get('source_topic')
+        self.details_topic = config.get('details_topic')
+        self.track_topic = config.get('track_topic')
+        self.command_topic = config.get('command_topic')
+
+        # A broker on the same host does not lose messages, skip the PUBACK round trip
+        host = config.get('mqtt_server', 'localhost')
+        self.qos = config.get('mqtt_qos', 0 if host in ('localhost', '127.0.0.1', '::1') else 1)
         
         # MQTT Configuration
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
@@ -75,38 +266,74 @@ class MQTTHandler:
         if username and password:
             self.client.username_pw_set(username, password)
         
-        self.handle_connection()
+        # Keep QoS 1 messages published while the broker is unreachable (QoS 0
+        # ones are dropped), and let several be in flight without waiting on each ack
+        self.client.max_queued_messages_set(1000)
+        self.client.max_inflight_messages_set(64)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+        self.handle_connection(host, config.get('mqtt_port', 1883))
     
-    def handle_connection(self):
-        # When not connected, try to reconnect
-        if not self.connected:
-            try:
-                self.client.connect(
-                    config.get('mqtt_server', 'localhost'), 
-                    config.get('mqtt_port', 1883)
-                )
-                self.client.loop_start()
-                logging.debug("MQTT Connection Established")
-            except Exception as e:
-                logging.warning(f"MQTT Connection Error: {e}")
+    def handle_connection(self, host, port):
+        # Connect in the background, the network loop keeps reconnecting
+        try:
+            self.client.connect_async(host, port, keepalive=60)
+            self.client.loop_start()
+            logging.debug("MQTT Connection Started")
+        except Exception as e:
+            logging.warning("MQTT Connection Error: %s", e)
 
     def on_connect(self, client, userdata, flags, reason_code, properties=None):
         """Connection callback to verify successful connection"""
         if reason_code.is_failure:
             self.connected = False
-            logging.warning(f"Failed to connect: {reason_code}. Will retry connection...")
+            logging.warning("Failed to connect: %s. Will retry connection...", reason_code)
         else:
             self.connected = True
-            self.client.subscribe(self.config.get('command_topic'))
-
-    def on_disconnect(self, client, userdata, rc, properties=None):
+            logging.debug("MQTT Connection Established")
+            if self.command_topic:
+                self.client.subscribe(self.command_topic)
+            # Anything published while disconnected may have been dropped
+            with self.lock:
+                self.sent.clear()
+                current = list(self.current.items())
+            for topic, (payload, qos, retain) in current:
+                self.publish_current(topic, payload, qos, retain)
+
+    def on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties=None):
         """Disconnection callback"""
-        logging.warning("Disconnected from MQTT broker")
+        logging.warning("Disconnected from MQTT broker: %s. Reconnecting...", reason_code)
         self.connected = False
+        with self.lock:
+            # The next state change sends every topic again
+            self.sent.clear()
+            unacked = sum(not info.is_published() for info in self.pending)
+        if unacked:
+            logging.warning("%s messages not acknowledged yet, they are resent after reconnect", unacked)
 
     def on_publish(self, client, userdata, mid, rc=None, properties=None):
         """Publish status callback (optional)"""
         pass
+
+    def publish_current(self, topic, payload, qos, retain):
+        """Publish a state topic unless paho already took this payload, remember it for reconnects"""
+        with self.lock:
+            self.current[topic] = (payload, qos, retain)
+            if self.sent.get(topic) == payload:
+                return
+        if self.publish(topic, payload, qos, retain):
+            with self.lock:
+                self.sent[topic] = payload
+
+    def publish(self, topic, payload, qos, retain):
+        """Publish without waiting for the broker, tracking unacknowledged QoS 1 messages"""
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if qos:
+            with self.lock:
+                self.pending = [i for i in self.pending if not i.is_published()]
+                self.pending.append(info)
+        # QoS 0 without a connection is dropped (MQTT_ERR_NO_CONN)
+        return info.rc == mqtt.MQTT_ERR_SUCCESS
     
     def on_message(self, client, userdata, message):
         """Message status callback (optional)"""
@@ -115,27 +342,42 @@ class MQTTHandler:
     def on_subscribe(self, client, userdata, mid, reason_code_list, properties):
         """Subscribe status callback"""
         if reason_code_list[0].is_failure:
-            logging.warning(f"Broker rejected you subscription: {reason_code_list[0]}")
+            logging.warning("Broker rejected you subscription: %s", reason_code_list[0])
         else:
-            logging.debug(f"Broker granted the following QoS: {reason_code_list[0].value}")
+            logging.debug("Broker granted the following QoS: %s", reason_code_list[0].value)
 
     def publish_moode(self, source, details):
-        """Publish moode audio state to MQTT topics"""
+        """Publish moode audio state to MQTT topics, skipping values that did not change"""
         try:
-            # Publish source
-            self.client.publish(self.config.get('source_topic'), str(source), qos=1, retain=False)
-            # Publish details
-            self.client.publish(self.config.get('details_topic'), str(details), qos=1, retain=False)
+            if self.state_topic:
+                # Single combined message, one PUBACK per state change, retained
+                # so subscribers get the current state as soon as they connect
+                payload = json.dumps({"source": str(source), "details": str(details)})
+                self.publish_current(self.state_topic, payload, qos=self.qos, retain=True)
+                return
+            self.publish_source(source)
+            self.publish_details(details)
         except Exception as e:
-            logging.error(f"MQTT Publish Error: {e}")
+            logging.error("MQTT Publish Error: %s", e)
+
+    def publish_source(self, source):
+        """Publish the audio source, retained so late subscribers see what is playing"""
+        if self.source_topic:
+            self.publish_current(self.source_topic, str(source), qos=self.qos, retain=True)
+
+    def publish_details(self, details):
+        """Publish the audio details, changes often so fire-and-forget"""
+        if self.details_topic:
+            self.publish_current(self.details_topic, str(details), qos=0, retain=False)
             
     def publish_spotify(self, track_info):
         """Publish Spotify track info to MQTT topics"""
         try:
             # Publish track information
-            self.client.publish(self.config.get('track_topic'), str(track_info), qos=1, retain=False)
+            if self.track_topic:
+                self.publish(self.track_topic, str(track_info), qos=self.qos, retain=False)
         except Exception as e:
-            logging.error(f"MQTT Publish Error: {e}")
+            logging.error("MQTT Publish Error: %s", e)
             
 class SpotifyClient:
     """ Spotify client for fetching song details """
@@ -149,7 +391,7 @@ class SpotifyClient:
         # Reject strings that are too short or too numeric
         if len(query) < 6:
             return False
-        tokens = re.findall(r'\w+', query)
+        tokens = WORD_RE.findall(query)
         if tokens:
             numeric_ratio = sum(token.isdigit() for token in tokens) / len(tokens)
             if numeric_ratio > 0.5:
@@ -170,7 +412,7 @@ class SpotifyClient:
                 return {"track_name": query, "artists": source, "album_image": ""}
             return None
         except Exception as e:
-            logging.error(f"Error searching track: {e}")
+            logging.error("Error searching track: %s", e)
 
     def format_track_message(self, track_result):
         """Extract track details from search result as a dictionary"""
@@ -203,32 +445,101 @@ class SpotifyClient:
         # Normalize both query and spotify string to address UTF issues
         norm_query = self.normalize_text(query)
         norm_spotify_str = self.normalize_text(spotify_str)
-        logging.debug(f"Normalized query: {norm_query}")
-        logging.debug(f"Normalized Spotify string: {norm_spotify_str}")
+        logging.debug("Normalized query: %s", norm_query)
+        logging.debug("Normalized Spotify string: %s", norm_spotify_str)
         
         score = fuzz.token_set_ratio(norm_query, norm_spotify_str)
-        logging.debug(f"Fuzzy score: {score}")
+        logging.debug("Fuzzy score: %s", score)
         return score >= threshold
 
-class AudioState:
-    """Class to track and compare audio playback states"""
-    def __init__(self):
-        self.current_pid = None
-        self.current_source = None
-        self.current_details = None
-        self.last_update = datetime.now()
-
-    def needs_refresh(self, min_interval=2):
-        """Check if state needs to be refreshed based on time interval"""
-        return (datetime.now() - self.last_update).total_seconds() >= min_interval
-
-    def __eq__(self, other):
-        """Compare two audio states for equality"""
-        if not isinstance(other, AudioState):
-            return False
-        return (self.current_pid == other.current_pid and
-                self.current_source == other.current_source and
-                self.current_details == other.current_details)
+class MPDClient:
+    """Minimal MPD protocol client over a persistent socket"""
+    __slots__ = ('socket_path', 'host', 'port', 'timeout', 'sock', 'reader', 'lock')
+
+    def __init__(self, config):
+        self.socket_path = config.get('mpd_socket', '/run/mpd/socket')
+        self.host = config.get('mpd_host', 'localhost')
+        self.port = config.get('mpd_port', 6600)
+        self.timeout = config.get('mpd_timeout', 1)
+        self.sock = None
+        self.reader = None
+        # Shared by the monitor loop and the periodic library update
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """Connect to MPD via its unix socket if present, TCP otherwise"""
+        self.close()
+        if os.path.exists(self.socket_path):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        else:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        greeting = self.reader.readline()
+        if not greeting.startswith(b'OK MPD '):
+            self.close()
+            raise ConnectionError(f"Unexpected MPD greeting: {greeting!r}")
+
+    def close(self):
+        """Close the connection to MPD"""
+        if self.sock:
+            try:
+                self.reader.close()
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.reader = None
+
+    def command(self, *commands):
+        """Run commands as one command list and return their merged key/value responses"""
+        request = ''.join(f'{command}\n' for command in commands)
+        if len(commands) > 1:
+            request = f'command_list_begin\n{request}command_list_end\n'
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if not self.sock:
+                        self.connect()
+                    self.sock.sendall(request.encode('utf-8'))
+                    return self.read_response()
+                except socket.timeout:
+                    # MPD is hanging, retrying would only stall the monitor loop longer
+                    self.close()
+                    raise
+                except (OSError, ConnectionError):
+                    # Broken pipe or MPD restarted, reconnect and retry once
+                    self.close()
+                    if attempt:
+                        raise
+
+    def read_response(self):
+        """Read key/value lines up to the final OK"""
+        response = {}
+        while True:
+            line = self.reader.readline()
+            if not line:
+                raise ConnectionError("MPD closed the connection")
+            line = line.decode('utf-8', 'replace').rstrip('\n')
+            if line == 'OK':
+                return response
+            if line.startswith('ACK '):
+                raise RuntimeError(f"MPD error: {line}")
+            key, _, value = line.partition(': ')
+            response[key] = value
+
+class AudioState(NamedTuple):
+    """Immutable audio playback state, compared as a plain tuple"""
+    current_pid: Optional[str] = None
+    current_source: Optional[str] = None
+    current_details: Optional[str] = None
+
+    @property
+    def publishable(self):
+        """The part of the state that is published to MQTT"""
+        return (self.current_source, self.current_details)
 
     def __str__(self):
         """String representation of the audio state"""
@@ -240,12 +551,12 @@ def load_config():
     """Load configuration from YAML file"""
     try:
         with open(CONFIG_PATH, 'r') as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=YamlLoader) or {}
     except FileNotFoundError:
-        logging.debug(f"Config file not found at {CONFIG_PATH}. Using default settings.")
+        logging.debug("Config file not found at %s. Using default settings.", CONFIG_PATH)
         return {}
     except yaml.YAMLError as e:
-        logging.error(f"Error parsing config file: {e}")
+        logging.error("Error parsing config file: %s", e)
         return {}
 
 def setup_logging(config):
@@ -281,185 +592,239 @@ def setup_logging(config):
     logging.getLogger('requests').setLevel(logging.WARNING)
     logging.getLogger('urllib3').setLevel(logging.WARNING)
 
+def find_status_files():
+    """List the card*/pcm*/sub*/status files under /proc/asound"""
+    status_files = []
+    for card in os.scandir(ASOUND_PATH):
+        if not card.name.startswith('card') or not card.is_dir():
+            continue
+        for pcm in os.scandir(card.path):
+            if not pcm.name.startswith('pcm') or not pcm.is_dir():
+                continue
+            for sub in os.scandir(pcm.path):
+                if sub.name.startswith('sub') and sub.is_dir():
+                    status_files.append(os.path.join(sub.path, 'status'))
+    return status_files
+
+def open_status_files():
+    """(Re)open the ALSA substream status files"""
+    global status_fds, status_fds_opened
+    for fd in status_fds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    status_fds = []
+    try:
+        status_files = find_status_files()
+    except OSError as e:
+        logging.debug("Cannot list ALSA status files: %s", e)
+        status_files = []
+    for status_file in status_files:
+        try:
+            status_fds.append(os.open(status_file, os.O_RDONLY))
+        except OSError as e:
+            logging.debug("Cannot open %s: %s", status_file, e)
+    status_fds_opened = time.monotonic()
+
 def get_card_status():
     """Get the audio card status from proc filesystem"""
+    global status_fds_opened
+    # Without any card there is nothing to poll, rescan on the timer only
+    if time.monotonic() - status_fds_opened >= STATUS_FILES_REFRESH:
+        open_status_files()
     try:
-        status_files = glob.glob('/proc/asound/card*/pcm*/sub*/status')
-        for status_file in status_files:
-            with open(status_file, 'r') as f:
-                content = f.read()
-                if 'state: RUNNING' in content:
-                    pid_match = re.search(r'owner_pid\s+:\s+(\d+)', content)
-                    if pid_match:
-                        return pid_match.group(1)
+        for index, fd in enumerate(status_fds):
+            content = os.pread(fd, 1024, 0)
+            if b'state: RUNNING' in content:
+                # Usually the same substream keeps playing, check it first next time
+                if index:
+                    status_fds.insert(0, status_fds.pop(index))
+                # Fixed "owner_pid   : 1234" layout, slice it out without a regex
+                start = content.find(b'owner_pid')
+                if start >= 0:
+                    start = content.find(b':', start) + 1
+                    end = content.find(b'\n', start)
+                    pid = content[start:end if end >= 0 else len(content)].strip()
+                    if pid.isdigit():
+                        return pid.decode('ascii')
+    except OSError as e:
+        # Card went away (e.g. ENODEV), reopen on the next poll
+        logging.debug("Error reading card status: %s", e)
+        status_fds_opened = float('-inf')
     except Exception as e:
-        logging.error(f"Error reading card status: {e}")
+        logging.error("Error reading card status: %s", e)
     return None
 
-def get_process_cmdline(pid):
-    """Get command line for given PID"""
+def read_proc_file(path, size=4096):
+    """Read a procfs file in a single read() call"""
+    fd = os.open(path, os.O_RDONLY)
     try:
-        with open(f'/proc/{pid}/cmdline', 'r') as f:
-            return f.read()
-    except Exception as e:
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+def get_process_name(pid):
+    """Get executable name of the process owning the given thread ID as raw bytes"""
+    try:
+        # ALSA's owner_pid is the thread that opened the PCM (e.g. MPD's
+        # "output:ALSA Def"), its comm is the thread name, so go through the
+        # Tgid to the process first
+        status = read_proc_file(f'/proc/{pid}/status')
+        start = status.find(b'\nTgid:')
+        if start >= 0:
+            end = status.find(b'\n', start + 1)
+            pid = status[start + 6:end if end >= 0 else len(status)].strip().decode('ascii')
+        return read_proc_file(f'/proc/{pid}/comm').rstrip(b'\n')
+    except OSError:
+        # Process exited between reading the card status and here
         return None
 
 def get_spotify_status():
     """Get current Spotify song from librespot log with proper confirmation"""
-    global config
-    cached = log_cache.get('spotify_status')
-    if cached:
-        return cached
-
     try:
-        with open('/var/log/moode_librespot.log', 'r') as f:
-            lines = deque(f, maxlen=config.get('max_lines_librespot', 100))  # Read only last 100 lines
-            pending_song = None
-            playing_song = False
-            
-            # Read lines in reverse to get most recent events
-            for line in reversed(lines):
-                # Check for Load command first (confirms actual playback)
-                if 'kPlayStatusPlay' in line:
-                    playing_song = True
-                    continue
-                
-                # Store potential song but don't confirm it yet
-                if playing_song and 'Loading <' in line:
-                    match = re.search(r'Loading <(.+?)> with', line)
-                    if match and not pending_song:
-                        result = match.group(1)
-                        log_cache.set('spotify_status', result)
-                        return result
-                        
+        return librespot_log.latest()
     except Exception as e:
         return None
-    return None
 
 def get_airplay_device():
     """Get AirPlay device from shairport-sync log"""
-    cached = log_cache.get('airplay_device')
-    if cached:
-        return cached
-
     try:
-        with open('/var/log/moode_shairport-sync.log', 'r') as f:
-            lines = deque(f, maxlen=config.get('max_lines_airplay', 30))  # Read only last 30 lines
-            for line in reversed(lines):
-                if 'connection from' in line:
-                    match = re.search(r'\("([^"]+)"\)', line)
-                    if match:
-                        result = match.group(1)
-                        log_cache.set('airplay_device', result)
-                        return result
+        return shairport_log.latest()
     except Exception as e:
         return "Unknown device"
 
+@lru_cache(maxsize=256)
 def format_radio_name(url):
     """Format radio station URL into display name"""
-    # Remove port number if present
-    url = url.split('/')[2].split(':')[0]
-    # Remove domain extensions
-    url = re.sub(r'\.\w{2,3}$', '', url)
-    # Replace dot with spaces
-    url = url.replace('.', ' ')
-    # Remove keywords = live, stream
-    url = re.sub(r'\b(live|stream)\b', '', url)
-    # Remove whitespace
-    url = url.strip()
-    # Convert to upper case
-    url = url.upper()
-    return url
+    # Host without port number
+    host = url.split('/', 3)[2].split(':', 1)[0]
+    # Remove domain extension and keywords (live, stream) in one pass,
+    # then turn dots into spaces and convert to upper case
+    return RADIO_HOST_CLEANUP_RE.sub('', host).translate(DOTS_TO_SPACES).strip().upper()
 
+@lru_cache(maxsize=256)
 def format_radio_details(details):
     """Format radio details string"""
     # With regex remove positive or negative number after last star
     # Examples: "LINK * 1002264", "SPOT * 100% Grandi Successi * -1"
-    details = re.sub(r'\s*\*\s*[-+]?\d+$', '', details)
+    if '*' in details:
+        details = TRAILING_NUMBER_RE.sub('', details)
     return details
 
 def get_radio_info():
     """Get current radio station info"""
     try:
-        # First check if MPD is actually playing
-        status_result = subprocess.run(['mpc', 'status'], capture_output=True, text=True, timeout=10)
-        status_output = status_result.stdout.strip().split('\n')
-        
-        # Check if it's actually playing
-        if len(status_output) > 1 and '[playing]' not in status_output[1]:
-            return None, None  # Not playing, return None to indicate no active playback
-            
+        # One round trip; the keys used below (state, file, Name, Artist, Title)
+        # each come from only one of the two responses
+        song = mpd_client.command('status', 'currentsong')
+
         # Only proceed with getting details if actually playing
-        if len(status_output) < 2:
-            return None, None
+        if song.get('state') != 'play':
+            return None, None  # Not playing, return None to indicate no active playback
 
-        if status_output[0].startswith('http'):
-            source = format_radio_name(status_output[0])
+        file = song.get('file', '')
+        name = song.get('Name')
+        title = song.get('Title')
+        if title and song.get('Artist'):
+            title = f"{song['Artist']} - {title}"
+
+        if name and title:
+            source = name
+            details = format_radio_details(title)
+        elif name or title:
+            source = format_radio_name(file) if file.startswith('http') else None
+            details = format_radio_details(name or title)
+        elif file.startswith('http'):
+            source = format_radio_name(file)
             details = None
-        elif len(status_output[0].split(':')) > 1:
-            source = status_output[0].split(':')[0]
-            details = format_radio_details(status_output[0].split(':')[1].strip())
         else:
-            source_result = subprocess.run(['mpc', 'current', '--format', '%file%'], 
-                                        capture_output=True, text=True)
-            source_output = source_result.stdout.strip()
-            source = format_radio_name(source_output) if source_output.startswith('http') else None
-            details = format_radio_details(status_output[0])
-            
-        # Only cache if we have valid data
-        if source and source.strip():
-            log_cache.set('radio_info', (source, details))
+            source = None
+            details = format_radio_details(file)
         return source, details
-    except subprocess.TimeoutExpired:
-        logging.debug("GET_RADIO_INFO timed out")
+    except socket.timeout:
+        # MPD is busy (e.g. updating the library), not stopped
+        raise
     except Exception as e:
-        logging.debug(f"Error getting radio info: {e}")
+        logging.debug("Error getting radio info: %s", e)
         return None, None
 
-def mpc_maintenance():
-    """Perform maintenance tasks for MPD"""
+def mpc_maintenance(interval):
+    """Perform maintenance tasks for MPD, then schedule the next run"""
     try:
-        result = subprocess.run(['mpc', 'update'], capture_output=True, text=True, timeout=10)
-        mpc_result = result.stdout.replace('\n', '').strip()
-        logging.debug(f"MPD Update: {mpc_result}")
-    except subprocess.TimeoutExpired:
-        logging.debug("MPC_MAINTENANCE timed out")
+        # MPD answers with a job id right away and updates in the background
+        result = mpd_client.command('update')
+        logging.debug("MPD Update: job %s", result.get('updating_db'))
     except Exception as e:
-        logging.debug(f"MPC_MAINTENANCE error: {e}")
-
-def get_current_state():
+        logging.debug("MPC_MAINTENANCE error: %s", e)
+    schedule_mpc_maintenance(interval)
+
+def schedule_mpc_maintenance(interval):
+    """Run mpc_maintenance after interval seconds, never if interval is 0"""
+    if interval:
+        timer = threading.Timer(interval, mpc_maintenance, args=(interval,))
+        timer.daemon = True
+        timer.start()
+
+# Playback source readers keyed by the name of the process owning the PCM
+SOURCES_BY_PROCESS = {
+    b'librespot': lambda: ("Spotify", get_spotify_status()),
+    b'shairport-sync': lambda: ("AirPlay", get_airplay_device()),
+    b'mpd': get_radio_info,
+}
+
+def invalidate_state_cache():
+    """Force the next get_current_state call to rescan the playback source"""
+    global cached_state, state_generation
+    state_generation += 1
+    cached_state = None
+
+def get_current_state(use_cache=True):
     """Get the current audio state"""
-    state = AudioState()
-    
+    global cached_state, cached_state_time, owner_pid, owner_name, last_state
+    generation = state_generation
     pid = get_card_status()
     if not pid:
         # Clear cache when no playback is detected
-        if hasattr(log_cache, 'cache'):
-            log_cache.cache.clear()
-        return state
-
-    state.current_pid = pid
-    cmdline = get_process_cmdline(pid)
-    if not cmdline:
-        return state
-
-    if 'librespot' in cmdline:
-        state.current_source = "Spotify"
-        state.current_details = get_spotify_status()
-    elif 'shairport-sync' in cmdline:
-        state.current_source = "AirPlay"
-        state.current_details = get_airplay_device()
-    elif 'mpd' in cmdline:
-        state.current_source, state.current_details = get_radio_info()
-        # If radio info returns None, this is truly no playback
-        if not state.current_source:
-            state.current_source = None
-            state.current_details = None
+        cached_state = None
+        last_state = AudioState()
+        return last_state
+
+    # Same process still owns the PCM, skip reading logs and MPD for a while
+    if (use_cache and cached_state and cached_state.current_pid == pid
+            and time.monotonic() - cached_state_time < STATE_CACHE_SECONDS):
+        return cached_state
+
+    # The source only depends on which process owns the PCM, so a known PID
+    # skips /proc/<pid>/comm and only its details are refreshed
+    if pid != owner_pid:
+        process_name = get_process_name(pid)
+        if not process_name:
+            return AudioState(current_pid=pid)
+        # Only remember the pair once the name is known
+        owner_pid, owner_name = pid, process_name
+    process_name = owner_name
+
+    get_source = SOURCES_BY_PROCESS.get(process_name)
+    if get_source:
+        try:
+            # A reader returning nothing (e.g. MPD stopped) means no playback
+            source, details = get_source() or (None, None)
+        except socket.timeout:
+            # No answer is not a stop, keep reporting what was known before
+            logging.debug("Timed out reading the playback source, keeping the last state")
+            return last_state or AudioState(current_pid=pid)
+        if not source:
+            details = None
     else:
-        state.current_source = "Unknown"
-        state.current_details = f"PID: {pid}"
-
-    state.last_update = datetime.now()
+        source = "Unknown"
+        details = f"PID: {pid}"
+
+    state = last_state = AudioState(pid, source, details)
+    # A log write or MPD event during the read may have made it stale already
+    if generation == state_generation:
+        cached_state = state
+        cached_state_time = time.monotonic()
     return state
 
 def wait_for_mpd():
@@ -470,21 +835,45 @@ def wait_for_mpd():
     
     while retry_count < max_retries:
         try:
-            result = subprocess.run(['mpc', 'status'], 
-                                 capture_output=True, 
-                                 text=True, 
-                                 timeout=10)
-            if result.returncode == 0:
-                logging.debug("MPD is ready")
-                return True
+            # Connects on first use, so this also waits for the socket to appear
+            mpd_client.command('ping')
+            logging.debug("MPD is ready")
+            return True
         except Exception as e:
-            logging.debug(f"MPD not ready: {e}")
+            logging.debug("MPD not ready: %s", e)
         
         retry_count += 1
         time.sleep(1)
     
     return False
 
+def watch_mpd_player(callback):
+    """Block on MPD's idle command and report player changes"""
+    # Separate connection without a timeout, idle blocks until something happens
+    idle_client = MPDClient(config)
+    idle_client.timeout = None
+    reconnected = False
+    while True:
+        try:
+            if reconnected:
+                # Player changes while MPD was away were not reported, recheck
+                # once the connection is back and before blocking again
+                idle_client.command('ping')
+                reconnected = False
+                callback()
+            idle_client.command('idle player')
+            callback()
+        except Exception as e:
+            logging.debug("MPD idle error: %s", e)
+            reconnected = True
+            time.sleep(5)
+
+def publish_track_info(spotify_handler, mqtt_handler, details, source):
+    """Look up the playing track on Spotify and publish it"""
+    spotify_track = spotify_handler.search_track(details, source)
+    logging.debug("Spotify track: %s", spotify_track)
+    mqtt_handler.publish_spotify(spotify_track)
+
 def main():
     """Main program loop"""
     # Load configuration
@@ -495,72 +884,117 @@ def main():
     setup_logging(config)
     
     logging.debug("Configuration loaded")
+    for key in sorted(set(config) - CONFIG_KEYS):
+        logging.warning("Unknown config key %s is ignored", key)
     
     
-    # Initialize cache and watchdog
-    global log_cache
-    log_cache = LogCache(max_age_seconds=config.get('log_cache_max_age', 5))
+    # Initialize watchdog
+    poll_interval = config.get('poll_interval', 1)
+    max_poll_interval = config.get('max_poll_interval', 10)
+    state_changed = threading.Event()
+
+    def on_source_changed():
+        invalidate_state_cache()
+        state_changed.set()
+
+    global librespot_log, shairport_log
+    librespot_log = LibrespotLog('/var/log/moode_librespot.log',
+                                 config.get('max_lines_librespot', 100))
+    shairport_log = ShairportLog('/var/log/moode_shairport-sync.log',
+                                 config.get('max_lines_airplay', 30))
+
     observer = Observer()
-    handler = LogWatcher(lambda: log_cache.cache.clear())
-    # Watch specific log files instead of whole directory
-    for log_file in LogWatcher.WATCHED_FILES:
-        if Path(log_file).exists():
-            observer.schedule(handler, Path(log_file).parent, recursive=False)
+    handler = LogWatcher(on_source_changed)
+    # Watch the log directory rather than the files, so logs created after
+    # startup (e.g. once a renderer is first enabled) still wake the loop
+    for log_dir in {Path(log_file).parent for log_file in LogWatcher.WATCHED_FILES}:
+        if log_dir.is_dir():
+            observer.schedule(handler, str(log_dir), recursive=False)
     observer.start()
     logging.debug("Log watcher started")
     
     # Wait for MPD to be ready
-    mpc_maintenance()
+    global mpd_client
+    mpd_client = MPDClient(config)
     if not wait_for_mpd():
         logging.warning("Failed to detect working MPD")
+    threading.Thread(target=watch_mpd_player, args=(on_source_changed,), daemon=True).start()
     
     # Initialize MQTT Handler
     mqtt_handler = MQTTHandler(config)
+
+    # Refresh the MPD library now and then, off the startup path
+    schedule_mpc_maintenance(config.get('mpd_update_interval', 3600))
     
-    # Initialize Spotify client
+    # Initialize Spotify client, lookups go over the network so run them
+    # on a worker thread instead of blocking the monitor loop
     spotify_handler = SpotifyClient(config)
+    track_lookup = ThreadPoolExecutor(max_workers=1)
     
     logging.info("Starting to monitor audio playback state")
     previous_state = AudioState()
+    previous_change = time.monotonic()
+    pending_state = None
+    pending_since = 0
+    interval = poll_interval
     
     while True:
         try:
-            if previous_state.needs_refresh():
-                current_state = get_current_state()
+            # Give a freshly published state a moment to settle
+            now = time.monotonic()
+            if now - previous_change >= 2:
+                # A pending change is confirmed against fresh data, not the cache
+                current_state = get_current_state(use_cache=pending_state is None)
                 
-                # Only print and publish if the state has changed
-                if current_state != previous_state:
-                    # Introduce a short delay to debounce state changes
-                    time.sleep(0.5)
-                    rechecked_state = get_current_state()
-                    
-                    # Confirm the state change after the delay
-                    if rechecked_state != previous_state:
+                # Only print and publish if the published state has changed,
+                # a new PID alone (e.g. restarted player) is not worth a publish
+                if current_state.publishable == previous_state.publishable:
+                    pending_state = None
+                elif pending_state is None or current_state.publishable != pending_state.publishable:
+                    # Debounce: wait for a second reading with the same state
+                    pending_state = current_state
+                    pending_since = now
+                    interval = DEBOUNCE_SECONDS
+                elif now - pending_since < DEBOUNCE_SECONDS:
+                    # Woken early by a log write, keep waiting out the debounce window
+                    interval = pending_since + DEBOUNCE_SECONDS - now
+                else:
+                    if logging.getLogger().isEnabledFor(logging.DEBUG):
                         logging.debug("="*50)
-                        logging.debug(rechecked_state)
+                        logging.debug(current_state)
                         logging.debug("="*50)
-                        
-                        mqtt_handler.handle_connection()
-                        mqtt_handler.publish_moode(
-                            rechecked_state.current_source if rechecked_state.current_source else "",
-                            rechecked_state.current_details if rechecked_state.current_details else ""
+                    
+                    mqtt_handler.publish_moode(current_state.current_source or "",
+                                               current_state.current_details or "")
+                    if current_state.current_details:
+                        track_lookup.submit(
+                            publish_track_info, spotify_handler, mqtt_handler,
+                            current_state.current_details, current_state.current_source
                         )
-                        if rechecked_state.current_details:
-                            spotify_track = spotify_handler.search_track(rechecked_state.current_details, rechecked_state.current_source)
-                            logging.debug(f"Spotify track: {spotify_track}")
-                            mqtt_handler.publish_spotify(spotify_track)
-                        
-                        previous_state = rechecked_state
+                    
+                    previous_state = current_state
+                    previous_change = time.monotonic()
+                    pending_state = None
+                    interval = poll_interval
             
-            # Wait before checking again
-            time.sleep(1)
+            # Sleep until a player log is written; the card status in /proc
+            # does not emit inotify events, so also recheck periodically,
+            # backing off only while the waits time out with nothing happening
+            if state_changed.wait(interval):
+                state_changed.clear()
+                interval = poll_interval
+            else:
+                interval = min(interval * 1.5, max_poll_interval)
             
         except KeyboardInterrupt:
             logging.info("Monitoring stopped.")
+            logging.debug("Radio name cache: %s", format_radio_name.cache_info())
+            logging.debug("Radio details cache: %s", format_radio_details.cache_info())
             observer.stop()
+            track_lookup.shutdown(wait=False)
             break
         except Exception as e:
-            logging.error(f"Error: {e}")
+            logging.exception("Error: %s", e)
             time.sleep(1)
     
     observer.join()